@@ -0,0 +1,213 @@
+"""
+Formatting and complexity analysis run by the analysis process pool.
+Pool workers import only this module, never the Flask app, so keep its
+dependencies to black and radon.
+"""
+
+import ast
+import heapq
+import signal
+from typing import Dict, Any, Tuple
+
+# Try importing optional libraries
+try:
+    import black
+except ImportError:
+    black = None
+
+try:
+    import radon.complexity as radon_cc
+    import radon.metrics as radon_metrics
+    import radon.raw as radon_raw
+    from radon.visitors import ComplexityVisitor
+except ImportError:
+    radon_cc = None
+    radon_metrics = None
+
+# Optional features are detected once at import
+FORMAT_AVAILABLE = black is not None
+COMPLEXITY_AVAILABLE = radon_cc is not None
+
+ALREADY_FORMATTED_TEMPLATE = {
+    "status": "success",
+    "message": "Code is already properly formatted! ✓",
+    "formatted_code": None,
+    "details": None,
+}
+
+# Black mode is validated once at startup and shared by every format request
+if FORMAT_AVAILABLE:
+    BLACK_MODE = black.FileMode(line_length=88, string_normalization=True, is_pyi=False)
+
+# Blocks above this cyclomatic complexity are called out in recommendations
+HIGH_COMPLEXITY = 10
+
+# At most this many blocks are listed in a complexity response
+MAX_REPORTED_FUNCTIONS = 500
+
+
+def count_lines(text: str) -> int:
+    """Count lines without building the list len(text.splitlines()) would"""
+    if not text:
+        return 0
+    return text.count("\n") + (not text.endswith("\n"))
+
+
+def warm_up_worker():
+    """Pay the analysers' one-time setup cost when a worker process starts"""
+    if FORMAT_AVAILABLE:
+        black.format_str("pass\n", mode=BLACK_MODE)
+    if COMPLEXITY_AVAILABLE:
+        ComplexityVisitor.from_ast(ast.parse("pass\n"))
+
+
+def _raise_analysis_timeout(signum, frame):
+    raise TimeoutError("Analysis exceeded its time limit")
+
+
+def run_with_deadline(func, code: str, timeout: float) -> Tuple[Dict[str, Any], int]:
+    """Run func(code) in a pool worker, aborting it after timeout seconds"""
+    previous_handler = signal.signal(signal.SIGALRM, _raise_analysis_timeout)
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        return func(code)
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous_handler)
+
+
+def format_code(code: str) -> Tuple[Dict[str, Any], int]:
+    """Format syntactically valid code with Black, returning (payload, status)"""
+    try:
+        formatted_code = black.format_file_contents(code, fast=True, mode=BLACK_MODE)
+    except black.NothingChanged:
+        formatted_code = code
+
+    # Pasted code often just lacks the final newline; that alone is no change.
+    # Black only ever appends "\n", so length and prefix are enough to tell.
+    if formatted_code is code or (
+        len(formatted_code) == len(code) + 1 and formatted_code.startswith(code)
+    ):
+        payload = ALREADY_FORMATTED_TEMPLATE.copy()
+        payload["formatted_code"] = formatted_code
+        payload["details"] = {"changed": False, "lines": count_lines(formatted_code)}
+        return payload, 200
+
+    return (
+        {
+            "status": "success",
+            "message": "Code has been formatted successfully! ✓",
+            "formatted_code": formatted_code,
+            "details": {
+                "changed": True,
+                "original_lines": count_lines(code),
+                "formatted_lines": count_lines(formatted_code),
+            },
+        },
+        200,
+    )
+
+
+def analyze_complexity(code: str) -> Tuple[Dict[str, Any], int]:
+    """Analyze complexity of syntactically valid code, returning (payload, status)"""
+    tree = ast.parse(code)
+
+    # Walk the tree once for both per-block and total complexity
+    visitor = ComplexityVisitor.from_ast(tree)
+    complexity_results = visitor.blocks
+    raw_metrics = radon_raw.analyze(code)
+    comment_lines = raw_metrics.comments + raw_metrics.multi
+    metrics_results = radon_metrics.mi_compute(
+        radon_metrics.h_visit_ast(tree).total.volume,
+        visitor.total_complexity,
+        raw_metrics.lloc,
+        comment_lines / float(raw_metrics.sloc) * 100 if raw_metrics.sloc else 0,
+    )
+
+    # Per-block fields are kept as parallel columns; rows are built for the response
+    names, types, complexities, lines, ranks = [], [], [], [], []
+    for result in complexity_results:
+        names.append(result.name)
+        types.append(result.__class__.__name__.lower().replace("node", ""))
+        complexities.append(result.complexity)
+        lines.append(result.lineno)
+        ranks.append(result.letter)
+    total_complexity = sum(complexities)
+
+    # List blocks most complex first, capped to bound the response size.
+    # Blocks of equal complexity keep their source order.
+    reported = heapq.nlargest(
+        MAX_REPORTED_FUNCTIONS, range(len(names)), key=complexities.__getitem__
+    )
+
+    mi_score = metrics_results if isinstance(metrics_results, (int, float)) else 0
+
+    if total_complexity <= 10:
+        assessment = "Low complexity - Easy to maintain"
+    elif total_complexity <= 20:
+        assessment = "Moderate complexity - Generally maintainable"
+    elif total_complexity <= 50:
+        assessment = "High complexity - Consider refactoring"
+    else:
+        assessment = "Very high complexity - Refactoring recommended"
+
+    return (
+        {
+            "status": "success",
+            "message": "Complexity analysis completed! ✓",
+            "analysis": {
+                "total_complexity": total_complexity,
+                "maintainability_index": round(mi_score, 2) if mi_score else "N/A",
+                "functions": [
+                    {
+                        "name": names[i],
+                        "type": types[i],
+                        "complexity": complexities[i],
+                        "line": lines[i],
+                        "rank": ranks[i],
+                    }
+                    for i in reported
+                ],
+                "assessment": assessment,
+                "recommendations": get_complexity_recommendations(
+                    total_complexity, names, complexities
+                ),
+            },
+            "details": {
+                "functions_analyzed": len(names),
+                "functions_omitted": len(names) - len(reported),
+                "lines_analyzed": count_lines(code),
+            },
+        },
+        200,
+    )
+
+
+def get_complexity_recommendations(
+    total_complexity: int, names: list, complexities: list
+) -> list:
+    """Generate recommendations based on complexity analysis"""
+    recommendations = []
+
+    if total_complexity > 20:
+        recommendations.append(
+            "Consider breaking down complex functions into smaller ones"
+        )
+
+    high_complexity_functions = [
+        name
+        for name, complexity in zip(names, complexities)
+        if complexity > HIGH_COMPLEXITY
+    ]
+    if high_complexity_functions:
+        recommendations.append(
+            f"Functions with high complexity: {', '.join(high_complexity_functions)}"
+        )
+
+    if len(names) > 10:
+        recommendations.append("Consider organizing code into classes or modules")
+
+    if not recommendations:
+        recommendations.append("Code complexity looks good! Keep up the good work.")
+
+    return recommendations
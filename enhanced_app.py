@@ -4,34 +4,89 @@ A robust web service for checking, linting, and formatting Python code.
 """
 
 import os
+import re
+import atexit
+import io
 import logging
-import tempfile
-import subprocess
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime
-from functools import wraps
-from typing import Dict, Any, Optional
-
-from flask import Flask, render_template, request, jsonify
-from flask_cors import CORS
+from functools import lru_cache, wraps
+from logging.handlers import QueueHandler, QueueListener, WatchedFileHandler
+from multiprocessing import get_context
+from operator import itemgetter
+from typing import Dict, Any, Optional, Tuple
+
+import orjson
+from flask import Flask, Response, render_template, request
+from flask.json.provider import JSONProvider
 from werkzeug.exceptions import RequestEntityTooLarge
 
+from analysis_worker import (
+    COMPLEXITY_AVAILABLE,
+    FORMAT_AVAILABLE,
+    analyze_complexity,
+    count_lines,
+    format_code,
+    run_with_deadline,
+    warm_up_worker,
+)
+
 # Try importing optional libraries
 try:
     import flake8
+    from flake8.api import legacy as flake8_api
+    from flake8.checker import FileChecker
+    from flake8.processor import FileProcessor
+    from flake8.style_guide import Decision
+    from flake8.violation import Violation
 except ImportError:
     flake8 = None
 
 try:
-    import black
+    import redis
 except ImportError:
-    black = None
+    redis = None
 
-try:
-    import radon.complexity as radon_cc
-    import radon.metrics as radon_metrics
-except ImportError:
-    radon_cc = None
-    radon_metrics = None
+# Optional features are detected once at import
+LINT_AVAILABLE = flake8 is not None
+
+# Bodies for the 503 responses returned when an optional feature is missing
+LINT_UNAVAILABLE_BODY = orjson.dumps(
+    {
+        "status": "error",
+        "message": "Linting is not available. The 'flake8' library is not installed.",
+    }
+)
+FORMAT_UNAVAILABLE_BODY = orjson.dumps(
+    {
+        "status": "error",
+        "message": "Formatting is not available. The 'black' library is not installed.",
+    }
+)
+COMPLEXITY_UNAVAILABLE_BODY = orjson.dumps(
+    {
+        "status": "error",
+        "message": "Complexity analysis is not available. The 'radon' library is not installed.",
+    }
+)
+
+# Shells for the most common success responses; handlers copy one and fill in
+# the per-request values instead of building the whole dict each time
+SYNTAX_OK_TEMPLATE = {
+    "status": "success",
+    "message": "Syntax is valid! ✓",
+    "details": None,
+}
+LINT_CLEAN_TEMPLATE = {
+    "status": "success",
+    "message": "No linting issues found! ✓",
+    "details": None,
+}
 
 
 # Configuration
@@ -39,57 +94,170 @@ class Config:
     SECRET_KEY = os.environ.get("SECRET_KEY") or "dev-secret-key-change-in-production"
     MAX_CONTENT_LENGTH = 1024 * 1024  # 1MB max file size
     RATE_LIMIT_PER_MINUTE = 60
+    REDIS_URL = os.environ.get("REDIS_URL")
+    REDIS_TIMEOUT = 0.1  # seconds; past this the local rate limiter takes over
+    REDIS_RETRY_AFTER = 5  # seconds to stay on the local limiter after a Redis error
+    ANALYSIS_TIMEOUT = 30  # seconds; enforced inside the worker running the job
+    ANALYSIS_GRACE_PERIOD = 2  # seconds the web worker waits on top of that
     DEBUG = os.environ.get("FLASK_DEBUG", "False").lower() == "true"
 
 
+class ORJSONProvider(JSONProvider):
+    """JSON provider that encodes and decodes with orjson"""
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        return orjson.dumps(obj).decode()
+
+    def loads(self, s: Any, **kwargs: Any) -> Any:
+        return orjson.loads(s)
+
+
 app = Flask(__name__)
 app.config.from_object(Config)
+app.json = ORJSONProvider(app)
+
+JSON_MIMETYPE = "application/json"
+
+
+def json_response(payload: Dict[str, Any], status: int = 200) -> Response:
+    """Serialize payload with orjson straight into a response"""
+    return Response(orjson.dumps(payload), status=status, mimetype=JSON_MIMETYPE)
+
+
+# CORS is open to all origins, so the headers are the same for every response
+CORS_HEADERS = {
+    "Access-Control-Allow-Origin": "*",
+    "Access-Control-Allow-Methods": "GET,POST,OPTIONS",
+    "Access-Control-Allow-Headers": "Content-Type",
+}
 
-# Enable CORS for all routes
-CORS(app, origins="*")
 
-# Configure logging
+@app.after_request
+def add_cors_headers(response):
+    """Attach the static CORS headers to every Flask response"""
+    response.headers.update(CORS_HEADERS)
+    return response
+
+
+# Configure logging. Request threads only enqueue records; a background
+# listener thread does the file and console writes. Several web workers may
+# append to app.log, so rotation is left to an external tool (e.g. logrotate);
+# WatchedFileHandler reopens the file once it has been moved.
+log_queue = queue.SimpleQueue()
+# Run as a script, this module is re-imported as __mp_main__ by every analysis
+# pool worker; only the web process opens app.log and runs the listener.
+if __name__ != "__mp_main__":
+    log_listener = QueueListener(
+        log_queue,
+        WatchedFileHandler("app.log"),
+        logging.StreamHandler(),
+        respect_handler_level=True,
+    )
+    log_listener.start()
+    atexit.register(log_listener.stop)
+
 logging.basicConfig(
     level=logging.INFO,
     format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    handlers=[logging.FileHandler("app.log"), logging.StreamHandler()],
+    handlers=[QueueHandler(log_queue)],
 )
 logger = logging.getLogger(__name__)
 
-# Simple rate limiting (in production, use Redis or similar)
-request_counts = {}
+# Token bucket rate limiting, shared across workers through Redis when configured.
+# Refills continuously at capacity/60s, so there is no burst at minute boundaries.
+TOKEN_BUCKET_LUA = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local bucket = redis.call("HMGET", KEYS[1], "tokens", "ts")
+local tokens = tonumber(bucket[1])
+local ts = tonumber(bucket[2])
+if tokens == nil or ts == nil then
+    tokens = capacity
+    ts = now
+end
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+end
+redis.call("HSET", KEYS[1], "tokens", tokens, "ts", now)
+redis.call("PEXPIRE", KEYS[1], math.ceil(capacity / rate))
+return {allowed, math.floor(tokens)}
+"""
+
+redis_client = None
+token_bucket = None
+if redis and Config.REDIS_URL:
+    redis_client = redis.Redis(
+        connection_pool=redis.ConnectionPool.from_url(
+            Config.REDIS_URL,
+            socket_timeout=Config.REDIS_TIMEOUT,
+            socket_connect_timeout=Config.REDIS_TIMEOUT,
+        )
+    )
+    token_bucket = redis_client.register_script(TOKEN_BUCKET_LUA)
+
+# In-process fallback when Redis is not available: per-IP counts for the current minute
+request_buckets: Dict[int, Counter] = {}
+
+# Monotonic time before which Redis is not retried after a failure
+redis_retry_at = 0.0
+
+
+def _allow_request_local(client_ip: str, max_requests: int) -> bool:
+    """Fixed-window counter kept in this process only"""
+    minute = int(time.monotonic() // 60)
+    bucket = request_buckets.get(minute)
+    if bucket is None:
+        # A new minute started, so every older bucket is stale
+        request_buckets.clear()
+        request_buckets[minute] = bucket = Counter()
+
+    bucket[client_ip] += 1
+    return bucket[client_ip] <= max_requests
+
+
+def _allow_request(client_ip: str, max_requests: int) -> bool:
+    """Consume one token for client_ip, returning False when the bucket is empty"""
+    global redis_retry_at
+    if token_bucket is None or time.monotonic() < redis_retry_at:
+        return _allow_request_local(client_ip, max_requests)
+
+    try:
+        allowed, _remaining = token_bucket(
+            keys=[f"rl:{client_ip}"],
+            args=[max_requests, max_requests / 60000.0, int(time.time() * 1000)],
+        )
+        return bool(allowed)
+    except redis.RedisError as e:
+        # Back off so an outage costs one timeout and one log line per window,
+        # not one per request
+        redis_retry_at = time.monotonic() + Config.REDIS_RETRY_AFTER
+        logger.error(
+            "Redis rate limiter unavailable, using local counter for %ss: %s",
+            Config.REDIS_RETRY_AFTER,
+            e,
+        )
+        return _allow_request_local(client_ip, max_requests)
 
 
 def rate_limit(max_requests: int = Config.RATE_LIMIT_PER_MINUTE):
-    """Simple rate limiting decorator"""
+    """Token bucket rate limiting decorator"""
 
     def decorator(f):
         @wraps(f)
         def decorated_function(*args, **kwargs):
             client_ip = request.environ.get("HTTP_X_FORWARDED_FOR", request.remote_addr)
-            current_minute = datetime.now().strftime("%Y-%m-%d %H:%M")
-            key = f"{client_ip}:{current_minute}"
-
-            if key in request_counts:
-                request_counts[key] += 1
-            else:
-                request_counts[key] = 1
-                # Clean old entries
-                keys_to_remove = [
-                    k for k in request_counts.keys() if not k.endswith(current_minute)
-                ]
-                for k in keys_to_remove:
-                    del request_counts[k]
-
-            if request_counts[key] > max_requests:
-                logger.warning(f"Rate limit exceeded for {client_ip}")
-                return (
-                    jsonify(
-                        {
-                            "status": "error",
-                            "message": "Rate limit exceeded. Please try again later.",
-                        }
-                    ),
+
+            if not _allow_request(client_ip, max_requests):
+                logger.warning("Rate limit exceeded for %s", client_ip)
+                return json_response(
+                    {
+                        "status": "error",
+                        "message": "Rate limit exceeded. Please try again later.",
+                    },
                     429,
                 )
 
@@ -100,6 +268,14 @@ def rate_limit(max_requests: int = Config.RATE_LIMIT_PER_MINUTE):
     return decorator
 
 
+# Potentially dangerous imports/operations, matched in a single pass
+DANGEROUS_PATTERN_RE = re.compile(
+    r"import\s+(?:os|subprocess|sys|shutil)"
+    r"|exec\(|eval\(|__import__|open\(|file\(|input\(|raw_input\(",
+    re.IGNORECASE,
+)
+
+
 def validate_code_input(code: str) -> Optional[str]:
     """Validate code input and return error message if invalid"""
     if not code or not isinstance(code, str):
@@ -111,39 +287,37 @@ def validate_code_input(code: str) -> Optional[str]:
     if len(code) > 50000:  # 50KB limit
         return "Code input is too large (max 50KB)"
 
-    # Check for potentially dangerous imports/operations
-    dangerous_patterns = [
-        "import os",
-        "import subprocess",
-        "import sys",
-        "import shutil",
-        "exec(",
-        "eval(",
-        "__import__",
-        "open(",
-        "file(",
-        "input(",
-        "raw_input(",
-    ]
-
-    code_lower = code.lower()
-    for pattern in dangerous_patterns:
-        if pattern in code_lower:
+    # Check for potentially dangerous imports/operations. Matches are only
+    # logged for monitoring, never blocked, so skip the scan if nobody listens.
+    if logger.isEnabledFor(logging.WARNING):
+        match = DANGEROUS_PATTERN_RE.search(code)
+        if match:
             logger.warning(
-                f"Potentially dangerous code pattern detected: {pattern}"
+                "Potentially dangerous code pattern detected: %s", match.group(0)
             )
-            # Don't block, just log for monitoring
 
     return None
 
 
+@lru_cache(maxsize=128)
+def check_syntax(code: str) -> Optional[SyntaxError]:
+    """Compile code and return its SyntaxError, if any.
+
+    Only the outcome is memoized, not the tree, so repeated submissions
+    (e.g. "check" then "format") skip compiling without holding large ASTs.
+    """
+    try:
+        compile(code, "<string>", "exec")
+    except SyntaxError as e:
+        return e
+    return None
+
+
 @app.errorhandler(413)
 def request_entity_too_large(error):
     """Handle file too large error"""
-    return (
-        jsonify(
-            {"status": "error", "message": "Request too large. Maximum file size is 1MB."}
-        ),
+    return json_response(
+        {"status": "error", "message": "Request too large. Maximum file size is 1MB."},
         413,
     )
 
@@ -151,14 +325,12 @@ def request_entity_too_large(error):
 @app.errorhandler(500)
 def internal_server_error(error):
     """Handle internal server errors"""
-    logger.error(f"Internal server error: {error}")
-    return (
-        jsonify(
-            {
-                "status": "error",
-                "message": "An internal server error occurred. Please try again later.",
-            }
-        ),
+    logger.error("Internal server error: %s", error)
+    return json_response(
+        {
+            "status": "error",
+            "message": "An internal server error occurred. Please try again later.",
+        },
         500,
     )
 
@@ -169,21 +341,78 @@ def index():
     return render_template("index.html")
 
 
+# Health body cached as (epoch second, bytes); the timestamp has 1s granularity
+_health_cache = (None, b"")
+
+
+def health_body() -> bytes:
+    """Return the encoded health check payload, re-encoding at most once per second"""
+    global _health_cache
+    now = int(time.time())
+    cached_second, body = _health_cache
+    if cached_second != now:
+        body = orjson.dumps(
+            {
+                "status": "healthy",
+                "timestamp": datetime.fromtimestamp(now).isoformat(),
+                "features": {
+                    "syntax_check": True,
+                    "linting": LINT_AVAILABLE,
+                    "formatting": FORMAT_AVAILABLE,
+                    "complexity_analysis": COMPLEXITY_AVAILABLE,
+                },
+            }
+        )
+        _health_cache = (now, body)
+    return body
+
+
 @app.route("/health")
 def health_check():
     """Health check endpoint"""
-    return jsonify(
-        {
-            "status": "healthy",
-            "timestamp": datetime.now().isoformat(),
-            "features": {
-                "syntax_check": True,
-                "linting": flake8 is not None,
-                "formatting": black is not None,
-                "complexity_analysis": radon_cc is not None,
-            },
-        }
-    )
+    return Response(health_body(), mimetype=JSON_MIMETYPE)
+
+
+class FastPathMiddleware:
+    """WSGI middleware answering GET /health and CORS preflights without Flask"""
+
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+        self.cors_headers = list(CORS_HEADERS.items())
+
+    def __call__(self, environ, start_response):
+        method = environ.get("REQUEST_METHOD")
+        if method == "GET" and environ.get("PATH_INFO") == "/health":
+            body = health_body()
+            start_response(
+                "200 OK",
+                [
+                    ("Content-Type", JSON_MIMETYPE),
+                    ("Content-Length", str(len(body))),
+                    *self.cors_headers,
+                ],
+            )
+            return [body]
+        if method == "OPTIONS" and "HTTP_ACCESS_CONTROL_REQUEST_METHOD" in environ:
+            start_response(
+                "204 No Content", [("Content-Length", "0"), *self.cors_headers]
+            )
+            return [b""]
+        return self.wsgi_app(environ, start_response)
+
+
+app.wsgi_app = FastPathMiddleware(app.wsgi_app)
+
+
+# Bodies for the fixed 400 responses returned by process_code
+NOT_JSON_BODY = orjson.dumps({"status": "error", "message": "Request must be JSON"})
+INVALID_JSON_BODY = orjson.dumps({"status": "error", "message": "Invalid JSON data"})
+INVALID_ACTION_BODY = orjson.dumps(
+    {
+        "status": "error",
+        "message": "Invalid action. Must be one of: check, lint, format, complexity",
+    }
+)
 
 
 @app.route("/process_code", methods=["POST"])
@@ -192,11 +421,14 @@ def process_code():
     """Enhanced code processing endpoint"""
     try:
         if not request.is_json:
-            return jsonify({"status": "error", "message": "Request must be JSON"}), 400
+            return Response(NOT_JSON_BODY, status=400, mimetype=JSON_MIMETYPE)
 
-        data = request.get_json()
-        if not data:
-            return jsonify({"status": "error", "message": "Invalid JSON data"}), 400
+        try:
+            data = orjson.loads(request.get_data(cache=False))
+        except orjson.JSONDecodeError:
+            data = None
+        if not data or not isinstance(data, dict):
+            return Response(INVALID_JSON_BODY, status=400, mimetype=JSON_MIMETYPE)
 
         code = data.get("code", "")
         action = data.get("action", "check")
@@ -204,308 +436,299 @@ def process_code():
         # Validate inputs
         validation_error = validate_code_input(code)
         if validation_error:
-            return jsonify({"status": "error", "message": validation_error}), 400
+            return json_response({"status": "error", "message": validation_error}, 400)
 
-        if action not in ["check", "lint", "format", "complexity"]:
-            return (
-                jsonify(
-                    {
-                        "status": "error",
-                        "message": "Invalid action. Must be one of: check, lint, format, complexity",
-                    }
-                ),
-                400,
-            )
+        handler = ACTION_HANDLERS.get(action) if isinstance(action, str) else None
+        if handler is None:
+            return Response(INVALID_ACTION_BODY, status=400, mimetype=JSON_MIMETYPE)
 
-        logger.info(f"Processing code with action: {action}")
+        logger.info("Processing code with action: %s", action)
 
-        if action == "check":
-            return handle_syntax_check(code)
-        elif action == "lint":
-            return handle_linting(code)
-        elif action == "format":
-            return handle_formatting(code)
-        elif action == "complexity":
-            return handle_complexity_analysis(code)
+        return handler(code)
 
     except Exception as e:
-        logger.error(f"Error in process_code: {str(e)}", exc_info=True)
-        return (
-            jsonify(
-                {
-                    "status": "error",
-                    "message": "An unexpected error occurred while processing your code.",
-                }
-            ),
+        logger.error("Error in process_code: %s", e, exc_info=True)
+        return json_response(
+            {
+                "status": "error",
+                "message": "An unexpected error occurred while processing your code.",
+            },
             500,
         )
 
 
 def handle_syntax_check(code: str) -> Dict[str, Any]:
     """Handle syntax checking"""
-    try:
-        compile(code, "<string>", "exec")
-        return jsonify(
-            {
-                "status": "success",
-                "message": "Syntax is valid! ✓",
-                "details": {"lines": len(code.splitlines()), "characters": len(code)},
-            }
+    syntax_error = check_syntax(code)
+    if syntax_error is None:
+        payload = SYNTAX_OK_TEMPLATE.copy()
+        payload["details"] = {"lines": count_lines(code), "characters": len(code)}
+        return json_response(payload)
+    return json_response(
+        {
+            "status": "error",
+            "message": (
+                f"Syntax Error on line {syntax_error.lineno}: {syntax_error.msg}"
+            ),
+            "details": {
+                "line_number": syntax_error.lineno,
+                "column": syntax_error.offset,
+                "error_type": "SyntaxError",
+            },
+        }
+    )
+
+
+# Flake8 runs in-process against a single style guide built at startup.
+# NOTE: this relies on flake8 internals (StyleGuide._application and
+# FileChecker._make_processor), so keep the flake8 pin in requirements.txt
+# to versions this has been checked against.
+if LINT_AVAILABLE:
+
+    class SourceFileChecker(FileChecker):
+        """Flake8 file checker that reads its lines from memory instead of disk"""
+
+        def __init__(self, *, lines: list, **kwargs):
+            self.lines = lines
+            super().__init__(**kwargs)
+
+        def _make_processor(self) -> FileProcessor:
+            return FileProcessor(self.filename, self.options, lines=self.lines)
+
+    flake8_style = flake8_api.get_style_guide(
+        ignore=["W292", "W391", "E501", "E203"], max_line_length=88
+    )
+
+
+def run_flake8(code: str) -> list:
+    """Lint code with flake8 and return reported issues as 'Line row:col: message'"""
+    application = flake8_style._application
+    checker = SourceFileChecker(
+        filename="<string>",
+        plugins=application.plugins.checkers,
+        options=application.options,
+        # Split on newlines only, exactly as flake8 reads stdin
+        lines=io.StringIO(code).readlines(),
+    )
+    filename, results, _ = checker.run_checks()
+    guide = application.guide.style_guide_for(filename)
+
+    lint_errors = []
+    for error_code, line_number, column, text, physical_line in sorted(
+        results, key=itemgetter(1, 2)
+    ):
+        if guide.should_report_error(error_code) is not Decision.Selected:
+            continue
+        violation = Violation(
+            error_code, filename, line_number, (column or 0) + 1, text, physical_line
         )
-    except SyntaxError as e:
-        return jsonify(
-            {
-                "status": "error",
-                "message": f"Syntax Error on line {e.lineno}: {e.msg}",
-                "details": {
-                    "line_number": e.lineno,
-                    "column": e.offset,
-                    "error_type": "SyntaxError",
-                },
-            }
+        if violation.is_inline_ignored(application.options.disable_noqa):
+            continue
+        lint_errors.append(
+            f"Line {line_number}:{violation.column_number}: {error_code} {text}"
         )
+    return lint_errors
 
 
 def handle_linting(code: str) -> Dict[str, Any]:
     """Handle code linting with flake8"""
-    if not flake8:
-        return (
-            jsonify(
-                {
-                    "status": "error",
-                    "message": "Linting is not available. The 'flake8' library is not installed.",
-                }
-            ),
-            503,
-        )
+    if not LINT_AVAILABLE:
+        return Response(LINT_UNAVAILABLE_BODY, status=503, mimetype=JSON_MIMETYPE)
 
-    temp_file = None
     try:
-        with tempfile.NamedTemporaryFile(
-            mode="w+", suffix=".py", delete=False, encoding="utf-8"
-        ) as tmp:
-            tmp.write(code)
-            temp_file = tmp.name
-
-        result = subprocess.run(
-            ["flake8", "--ignore=W292,W391,E501,E203", "--max-line-length=88", temp_file],
-            capture_output=True,
-            text=True,
-            encoding="utf-8",
-            timeout=30,
-        )
+        lint_errors = run_flake8(code)
 
-        if not result.stdout.strip():
-            return jsonify(
-                {
-                    "status": "success",
-                    "message": "No linting issues found! ✓",
-                    "details": {
-                        "issues_count": 0,
-                        "lines_checked": len(code.splitlines()),
-                    },
-                }
-            )
+        if not lint_errors:
+            payload = LINT_CLEAN_TEMPLATE.copy()
+            payload["details"] = {"issues_count": 0, "lines_checked": count_lines(code)}
+            return json_response(payload)
         else:
-            raw_errors = result.stdout.strip().split("\n")
-            lint_errors = [
-                err.replace(temp_file + ":", "Line ") for err in raw_errors if temp_file in err
-            ]
-
-            return jsonify(
+            return json_response(
                 {
                     "status": "lint_errors",
                     "message": f"Found {len(lint_errors)} linting issue(s)",
                     "errors": lint_errors,
                     "details": {
                         "issues_count": len(lint_errors),
-                        "lines_checked": len(code.splitlines()),
+                        "lines_checked": count_lines(code),
                     },
                 }
             )
 
-    except subprocess.TimeoutExpired:
-        return jsonify(
-            {
-                "status": "error",
-                "message": "Linting operation timed out. Code may be too complex.",
-            }
-        ), 408
-
     except Exception as e:
-        logger.error(f"Error in linting: {str(e)}")
-        return jsonify({"status": "error", "message": f"Linting failed: {str(e)}"}), 500
+        logger.error("Error in linting: %s", e)
+        return json_response(
+            {"status": "error", "message": f"Linting failed: {str(e)}"}, 500
+        )
 
-    finally:
-        if temp_file and os.path.exists(temp_file):
-            try:
-                os.unlink(temp_file)
-            except OSError:
-                logger.warning(f"Failed to delete temporary file: {temp_file}")
+
+# Formatting and complexity analysis are CPU-bound, so they run in worker
+# processes; a pathological input then cannot stall the web worker or the GIL.
+# Workers come from a forkserver with nothing preloaded, so they never fork
+# from this multi-threaded process (the log listener thread is running), and
+# they only import analysis_worker, never this module.
+analysis_context = get_context("forkserver")
+analysis_context.set_forkserver_preload([])
+analysis_executor_lock = threading.Lock()
+analysis_executor = None
+
+
+def get_analysis_executor() -> ProcessPoolExecutor:
+    """Return the analysis pool, creating it on first use"""
+    global analysis_executor
+    with analysis_executor_lock:
+        if analysis_executor is None:
+            analysis_executor = ProcessPoolExecutor(
+                max_workers=os.cpu_count(),
+                mp_context=analysis_context,
+                initializer=warm_up_worker,
+            )
+        return analysis_executor
+
+
+def retire_analysis_executor(executor: ProcessPoolExecutor):
+    """Stop routing work to executor; the next request gets a fresh pool"""
+    global analysis_executor
+    with analysis_executor_lock:
+        if analysis_executor is executor:
+            analysis_executor = None
+    # Already-queued jobs still finish; idle workers exit straight away
+    executor.shutdown(wait=False)
+
+
+def run_analysis(func, code: str) -> Tuple[Dict[str, Any], int]:
+    """Run func(code) in the analysis pool and return its (payload, status).
+
+    The worker aborts the job itself after ANALYSIS_TIMEOUT and raises
+    TimeoutError. Waiting here runs out only if the job sat in the queue or
+    the worker missed that deadline; a job that is still running then keeps
+    its worker busy, so its pool is retired. A pool broken by a dead worker is replaced and the
+    job retried once; if that fails too, BrokenProcessPool propagates.
+    """
+    for attempt in range(2):
+        executor = get_analysis_executor()
+        try:
+            future = executor.submit(
+                run_with_deadline, func, code, Config.ANALYSIS_TIMEOUT
+            )
+            return future.result(
+                timeout=Config.ANALYSIS_TIMEOUT + Config.ANALYSIS_GRACE_PERIOD
+            )
+        except BrokenProcessPool:
+            retire_analysis_executor(executor)
+            if attempt:
+                raise
+        except TimeoutError:
+            if not future.done() and not future.cancel():
+                retire_analysis_executor(executor)
+            raise
 
 
 def handle_formatting(code: str) -> Dict[str, Any]:
     """Handle code formatting with Black"""
-    if not black:
-        return (
-            jsonify(
-                {
-                    "status": "error",
-                    "message": "Formatting is not available. The 'black' library is not installed.",
-                }
-            ),
-            503,
-        )
+    if not FORMAT_AVAILABLE:
+        return Response(FORMAT_UNAVAILABLE_BODY, status=503, mimetype=JSON_MIMETYPE)
 
     try:
-        try:
-            compile(code, "<string>", "exec")
-        except SyntaxError as e:
-            return jsonify(
+        syntax_error = check_syntax(code)
+        if syntax_error:
+            return json_response(
                 {
                     "status": "error",
-                    "message": f"Cannot format due to syntax error on line {e.lineno}: {e.msg}",
-                    "details": {"line_number": e.lineno, "error_type": "SyntaxError"},
+                    "message": (
+                        "Cannot format due to syntax error on line "
+                        f"{syntax_error.lineno}: {syntax_error.msg}"
+                    ),
+                    "details": {
+                        "line_number": syntax_error.lineno,
+                        "error_type": "SyntaxError",
+                    },
                 }
             )
 
-        formatted_code = black.format_str(
-            code,
-            mode=black.FileMode(line_length=88, string_normalization=True, is_pyi=False),
+        payload, status = run_analysis(format_code, code)
+        return json_response(payload, status)
+
+    except TimeoutError:
+        return json_response(
+            {
+                "status": "error",
+                "message": "Formatting operation timed out. Code may be too complex.",
+            },
+            408,
         )
 
-        if formatted_code.strip() == code.strip():
-            return jsonify(
-                {
-                    "status": "success",
-                    "message": "Code is already properly formatted! ✓",
-                    "formatted_code": formatted_code,
-                    "details": {
-                        "changed": False,
-                        "lines": len(formatted_code.splitlines()),
-                    },
-                }
-            )
-        else:
-            return jsonify(
-                {
-                    "status": "success",
-                    "message": "Code has been formatted successfully! ✓",
-                    "formatted_code": formatted_code,
-                    "details": {
-                        "changed": True,
-                        "original_lines": len(code.splitlines()),
-                        "formatted_lines": len(formatted_code.splitlines()),
-                    },
-                }
-            )
+    except BrokenProcessPool:
+        logger.error("Formatting worker pool failed twice in a row")
+        return json_response(
+            {
+                "status": "error",
+                "message": "Formatting is temporarily unavailable. Please try again.",
+            },
+            503,
+        )
 
     except Exception as e:
-        logger.error(f"Error in formatting: {str(e)}")
-        return jsonify({"status": "error", "message": f"Formatting failed: {str(e)}"}), 500
+        logger.error("Error in formatting: %s", e)
+        return json_response(
+            {"status": "error", "message": f"Formatting failed: {str(e)}"}, 500
+        )
 
 
 def handle_complexity_analysis(code: str) -> Dict[str, Any]:
     """Handle complexity analysis with Radon"""
-    if not radon_cc:
-        return (
-            jsonify(
-                {
-                    "status": "error",
-                    "message": "Complexity analysis is not available. The 'radon' library is not installed.",
-                }
-            ),
-            503,
-        )
+    if not COMPLEXITY_AVAILABLE:
+        return Response(COMPLEXITY_UNAVAILABLE_BODY, status=503, mimetype=JSON_MIMETYPE)
 
     try:
-        try:
-            compile(code, "<string>", "exec")
-        except SyntaxError as e:
-            return jsonify(
+        syntax_error = check_syntax(code)
+        if syntax_error:
+            return json_response(
                 {
                     "status": "error",
-                    "message": f"Cannot analyze complexity due to syntax error on line {e.lineno}: {e.msg}",
+                    "message": (
+                        "Cannot analyze complexity due to syntax error on line "
+                        f"{syntax_error.lineno}: {syntax_error.msg}"
+                    ),
                 }
             )
 
-        complexity_results = radon_cc.cc_visit(code)
-        metrics_results = radon_metrics.mi_visit(code, multi=True)
-
-        functions = []
-        total_complexity = 0
-
-        for result in complexity_results:
-            complexity_info = {
-                "name": result.name,
-                "type": result.__class__.__name__.lower().replace("node", ""),
-                "complexity": result.complexity,
-                "line": result.lineno,
-                "rank": result.letter,
-            }
-            functions.append(complexity_info)
-            total_complexity += result.complexity
-
-        mi_score = metrics_results if isinstance(metrics_results, (int, float)) else 0
+        payload, status = run_analysis(analyze_complexity, code)
+        return json_response(payload, status)
 
-        if total_complexity <= 10:
-            assessment = "Low complexity - Easy to maintain"
-        elif total_complexity <= 20:
-            assessment = "Moderate complexity - Generally maintainable"
-        elif total_complexity <= 50:
-            assessment = "High complexity - Consider refactoring"
-        else:
-            assessment = "Very high complexity - Refactoring recommended"
-
-        return jsonify(
+    except TimeoutError:
+        return json_response(
             {
-                "status": "success",
-                "message": "Complexity analysis completed! ✓",
-                "analysis": {
-                    "total_complexity": total_complexity,
-                    "maintainability_index": round(mi_score, 2) if mi_score else "N/A",
-                    "functions": functions,
-                    "assessment": assessment,
-                    "recommendations": get_complexity_recommendations(
-                        total_complexity, functions
-                    ),
-                },
-                "details": {
-                    "functions_analyzed": len(functions),
-                    "lines_analyzed": len(code.splitlines()),
-                },
-            }
+                "status": "error",
+                "message": "Complexity analysis timed out. Code may be too complex.",
+            },
+            408,
         )
 
-    except Exception as e:
-        logger.error(f"Error in complexity analysis: {str(e)}")
-        return jsonify(
-            {"status": "error", "message": f"Complexity analysis failed: {str(e)}"}
-        ), 500
-
-
-def get_complexity_recommendations(total_complexity: int, functions: list) -> list:
-    """Generate recommendations based on complexity analysis"""
-    recommendations = []
-
-    if total_complexity > 20:
-        recommendations.append(
-            "Consider breaking down complex functions into smaller ones"
+    except BrokenProcessPool:
+        logger.error("Complexity analysis worker pool failed twice in a row")
+        return json_response(
+            {
+                "status": "error",
+                "message": "Complexity analysis is temporarily unavailable. Please try again.",
+            },
+            503,
         )
 
-    high_complexity_functions = [f for f in functions if f["complexity"] > 10]
-    if high_complexity_functions:
-        recommendations.append(
-            f"Functions with high complexity: {', '.join([f['name'] for f in high_complexity_functions])}"
+    except Exception as e:
+        logger.error("Error in complexity analysis: %s", e)
+        return json_response(
+            {"status": "error", "message": f"Complexity analysis failed: {str(e)}"}, 500
         )
 
-    if len(functions) > 10:
-        recommendations.append("Consider organizing code into classes or modules")
-
-    if not recommendations:
-        recommendations.append("Code complexity looks good! Keep up the good work.")
 
-    return recommendations
+# Handlers for each process_code action
+ACTION_HANDLERS = {
+    "check": handle_syntax_check,
+    "lint": handle_linting,
+    "format": handle_formatting,
+    "complexity": handle_complexity_analysis,
+}
 
 
 if __name__ == "__main__":